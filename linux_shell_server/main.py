@@ -6,23 +6,24 @@ Fixed version to handle connection issues properly.
 """
 
 import asyncio
-import json
+import functools
 import logging
-import subprocess
-import sys
+import re
 import os
+import hashlib
 import shlex
-import shutil
 import signal
+import stat
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple
 from mcp.server import Server
 from mcp.types import (
     Tool,
     TextContent,
-    InitializeResult,
     Resource,
     Prompt
 )
@@ -37,171 +38,578 @@ DEFAULT_TIMEOUT = 30  # Reduced from 200 to 30 seconds
 MAX_TIMEOUT = 120     # Reduced from 500 to 120 seconds
 MAX_OUTPUT_SIZE = 10000  # Reduced from 50000 to 10000 characters
 CACHE_DURATION = 60   # Reduced cache duration
+CACHE_MAX_ENTRIES = 512  # LRU eviction kicks in beyond this many entries
+CACHE_MAX_BYTES = 8 * 1024 * 1024  # Cap on total cached output size
+CACHE_CLEANUP_INTERVAL = 300  # Seconds between background expiry sweeps
+# StreamReader buffer limit for subprocess pipes; the asyncio default of
+# 64 KiB raises LimitOverrunError on commands that emit long lines
+STREAM_LIMIT = max(1_048_576, MAX_OUTPUT_SIZE * 2)
+
+# Prebuilt suffix appended to truncated output
+_TRUNC_SUFFIX = f"\n... (output truncated, showing first {MAX_OUTPUT_SIZE} characters)"
 
 # Commands that typically take longer
 LONG_RUNNING_COMMANDS = {'find', 'grep', 'du', 'tar', 'zip', 'rsync', 'cp', 'mv'}
 # Commands safe to cache
 CACHEABLE_COMMANDS = {'ls', 'pwd', 'whoami', 'id', 'date', 'hostname', 'uname'}
 
+# Shell metacharacters that require going through /bin/sh; commands without
+# any of these can be exec'd directly, skipping one fork per call
+_NEEDS_SHELL = re.compile(r'[|&;<>$`*?()\[\]{}\\\'"~\n]')
+
+# Home directory never changes for the life of the process
+_HOME = os.path.expanduser("~")
+
+def _cache_key(command: str, cwd: str) -> bytes:
+    """Fixed-size digest key for the command cache.
+
+    blake2b is the fastest cryptographic hash in the stdlib; a 16-byte
+    digest keeps per-entry key memory constant and makes every subsequent
+    dict operation hash 16 bytes instead of an arbitrarily long command.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(command.encode())
+    h.update(b'\0')
+    h.update(cwd.encode())
+    return h.digest()
+
+@functools.lru_cache(maxsize=256)
+def _normalize_path(path: str, cwd: str) -> str:
+    """Expand ~/env vars in path and resolve it relative to cwd.
+
+    Pure in (path, cwd) for a fixed environment, so repeat arguments hit
+    the lru_cache instead of re-running the expansion string work. cwd is
+    part of the key, so no invalidation is needed when the current
+    directory changes.
+    """
+    expanded = os.path.expanduser(os.path.expandvars(path))
+    if not os.path.isabs(expanded):
+        expanded = os.path.join(cwd, expanded)
+    return os.path.abspath(expanded)
+
+def _is_dir(path: str) -> bool:
+    """True if path is an existing directory - one stat(2) instead of the
+    two issued by os.path.exists + os.path.isdir"""
+    try:
+        return stat.S_ISDIR(os.stat(path).st_mode)
+    except OSError:
+        return False
+
 # Claude workspace configuration
 CLAUDE_WORKSPACE_DIR = Path.home() / "claude-workspace"
 WORKSPACE_CLEANUP_DAYS = 7  # Clean up files older than this
+WORKSPACE_CLEANUP_THROTTLE = 3600  # At most one cleanup sweep per hour
+
+# Wall-clock time of the last cleanup sweep, shared across all executors in
+# the process so repeated ShellExecutor construction doesn't rescan the
+# workspace each time
+_last_cleanup = 0.0
+
+# Number of persistent bash workers kept warm for command dispatch
+WORKER_POOL_SIZE = 4
+
+# Upper bound on commands running at once - a client that pipelines hundreds
+# of tool calls shouldn't be able to trigger a fork storm
+MAX_CONCURRENT_COMMANDS = int(os.environ.get(
+    "SHELL_MAX_CONCURRENCY", str(min(8, os.cpu_count() or 8))))
+
+# Short-lived cache of execute_command cwd probes (positive and negative)
+CWD_CACHE_TTL = 5  # seconds
+CWD_CACHE_MAX = 64  # entries
 
 class CommandCache:
-    """Simple cache for command results"""
-    def __init__(self, max_age: int = CACHE_DURATION):
-        self.cache = {}
+    """Bounded LRU cache for command results with TTL expiry"""
+    def __init__(self, max_age: int = CACHE_DURATION,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.cache: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
         self.max_age = max_age
-    
-    def get(self, key: str) -> Optional[Dict[str, Any]]:
-        if key in self.cache:
-            result, timestamp = self.cache[key]
-            if time.time() - timestamp < self.max_age:
-                return result
-            else:
-                del self.cache[key]
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        result, timestamp = entry
+        # monotonic clock is immune to wall-clock jumps (NTP, DST)
+        if time.monotonic() - timestamp < self.max_age:
+            self.cache.move_to_end(key)
+            # Hand out a copy: callers annotate the result (cache marker),
+            # and mutating the stored entry would both stack markers across
+            # hits and desync total_bytes from the entry's real size
+            return dict(result)
+        self._evict(key)
         return None
-    
-    def set(self, key: str, result: Dict[str, Any]):
-        # Only cache successful results from safe commands
+
+    def set(self, key: bytes, result: Dict[str, Any], first_token: str):
+        # Only cache successful results from safe commands; the caller passes
+        # the already-extracted first token so no re-tokenization is needed
         if not result.get("error", False):
-            command_start = key.split()[0] if key.split() else ""
-            if command_start in CACHEABLE_COMMANDS:
-                self.cache[key] = (result, time.time())
+            if first_token in CACHEABLE_COMMANDS:
+                existing = self.cache.get(key)
+                if existing is not None:
+                    old_result, timestamp = existing
+                    # Conditional replacement: don't clobber a fresh entry
+                    # with strictly more output - the shorter result is more
+                    # likely a transient hiccup than an improvement
+                    if (time.monotonic() - timestamp < self.max_age
+                            and len(old_result.get("output", ""))
+                            > len(result.get("output", ""))):
+                        return
+                    self._evict(key)
+                self.cache[key] = (result, time.monotonic())
+                self.total_bytes += len(result.get("output", ""))
+                # Evict least-recently-used entries once either cap is exceeded
+                while (len(self.cache) > self.max_entries
+                       or self.total_bytes > self.max_bytes):
+                    self._evict(next(iter(self.cache)))
+
+    def _evict(self, key: bytes):
+        result, _ = self.cache.pop(key)
+        self.total_bytes -= len(result.get("output", ""))
+
+    def cleanup_expired(self):
+        """Drop every expired entry in one pass.
+
+        get() only evicts the entry it happens to probe, so entries for
+        commands that are never re-run would otherwise sit out their TTL
+        indefinitely; the background sweep in main() calls this periodically.
+        """
+        now = time.monotonic()
+        expired = [key for key, (_, timestamp) in self.cache.items()
+                   if now - timestamp >= self.max_age]
+        for key in expired:
+            self._evict(key)
 
 # Create a server instance
 server = Server("linux-shell-server")
 
+class _WorkerPool:
+    """Pool of long-lived bash workers used to avoid a fork+exec per command"""
+    def __init__(self, size: int = WORKER_POOL_SIZE):
+        self.size = size
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.subprocess.Process] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_loop(self):
+        """(Re)bind the pool to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Workers spawned on a previous loop can no longer be awaited,
+            # so kill them and start fresh on the current loop
+            for worker in self._workers:
+                self._kill_worker(worker)
+            self._workers = []
+            self._idle = asyncio.Queue()
+            self._loop = loop
+
+    @staticmethod
+    def _kill_worker(worker):
+        try:
+            if worker.returncode is None:
+                if hasattr(os, 'killpg') and worker.pid is not None:
+                    os.killpg(os.getpgid(worker.pid), signal.SIGKILL)
+                else:
+                    worker.kill()
+        except Exception:
+            pass
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        worker = await asyncio.create_subprocess_exec(
+            "bash", "--noprofile", "--norc",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            start_new_session=True
+        )
+        self._workers.append(worker)
+        return worker
+
+    async def warm(self):
+        """Pre-spawn the full complement of workers (called at server startup)"""
+        self._ensure_loop()
+        while len(self._workers) < self.size:
+            self._idle.put_nowait(await self._spawn())
+
+    async def acquire(self) -> asyncio.subprocess.Process:
+        """Get an idle worker, spawning a new one if the pool isn't full yet"""
+        self._ensure_loop()
+        while self._idle is not None and not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker.returncode is None:
+                return worker
+            self._forget(worker)
+        if len(self._workers) < self.size:
+            return await self._spawn()
+        return await self._idle.get()
+
+    async def release(self, worker):
+        """Return a healthy worker to the pool, replacing it if it died"""
+        if worker.returncode is None:
+            self._idle.put_nowait(worker)
+        else:
+            self._forget(worker)
+            self._idle.put_nowait(await self._spawn())
+
+    async def discard(self, worker):
+        """Kill a worker (e.g. after a timeout) and respawn a replacement"""
+        self._kill_worker(worker)
+        try:
+            await asyncio.wait_for(worker.wait(), timeout=5)
+        except Exception:
+            pass
+        self._forget(worker)
+        if len(self._workers) < self.size:
+            self._idle.put_nowait(await self._spawn())
+
+    def _forget(self, worker):
+        try:
+            self._workers.remove(worker)
+        except ValueError:
+            pass
+
+    async def run(self, command: str, cwd: str, timeout: int) -> Tuple[str, str, int]:
+        """Dispatch a command to an idle worker and read back its output"""
+        worker = await self.acquire()
+        # Unique per-call marker so stale output from a previous command can
+        # never be mistaken for this command's result
+        marker = f"__END__{os.urandom(8).hex()}__"
+        # eval of a quoted string keeps malformed input (e.g. an unbalanced
+        # quote) contained: bash reports the syntax error and moves on to the
+        # sentinel printfs, instead of swallowing them as part of the quoted
+        # text and stalling until the timeout. The subshell still isolates
+        # cd/variable side effects from the long-lived worker.
+        script = (
+            f"cd {shlex.quote(cwd)} && (eval {shlex.quote(command)}) < /dev/null\n"
+            f"__rc=$?\n"
+            f"printf '\\n%s%d__\\n' {marker} \"$__rc\"\n"
+            f"printf '\\n%s\\n' {marker} >&2\n"
+        )
+        try:
+            worker.stdin.write(script.encode())
+            await worker.stdin.drain()
+            stdout_data, stderr_data, exit_code = await asyncio.wait_for(
+                self._read_result(worker, marker.encode()),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Command timed out after %ss: %s", timeout, command)
+            await self.discard(worker)
+            raise TimeoutError(f"Command timed out after {timeout} seconds")
+        except Exception:
+            # Worker state is unknown (partial read, dead process) - replace it
+            await self.discard(worker)
+            raise
+        await self.release(worker)
+        # Clip at the bytes layer before decoding: anything past the char
+        # truncation threshold would be thrown away anyway, so don't pay to
+        # decode it (x4 is a generous envelope for multi-byte UTF-8)
+        byte_cap = MAX_OUTPUT_SIZE * 4
+        return (
+            stdout_data[:byte_cap].decode('utf-8', errors='replace'),
+            stderr_data[:byte_cap].decode('utf-8', errors='replace'),
+            exit_code
+        )
+
+    @staticmethod
+    async def _read_result(worker, marker: bytes) -> Tuple[bytes, bytes, int]:
+        """Read both streams until the sentinel marker, then parse the exit code.
+
+        Scans in 64 KiB chunks rather than readuntil(), which would buffer
+        the child's entire output and raise LimitOverrunError past the
+        stream limit. At most MAX_OUTPUT_SIZE * 4 bytes are retained;
+        anything beyond that is discarded while we keep draining until the
+        sentinel arrives, so oversized output can never wedge a worker.
+        """
+        byte_cap = MAX_OUTPUT_SIZE * 4
+        marker_len = len(marker)
+
+        async def read_stream(stream):
+            buf = bytearray()   # retained head of the output
+            window = b""        # tail kept to catch a marker spanning chunks
+            dropped = False
+            while True:
+                chunk = await stream.read(65536)
+                if not chunk:
+                    # Worker died mid-command; caller discards it
+                    raise asyncio.IncompleteReadError(bytes(buf), marker)
+                data = window + chunk
+                idx = data.find(marker)
+                if idx != -1:
+                    if not dropped:
+                        # Bytes before the marker that came in this chunk
+                        # (idx < len(window) means the marker began inside
+                        # bytes already appended - trim them back off)
+                        buf = buf[:len(buf) - len(window) + idx] \
+                            if idx < len(window) \
+                            else buf + data[len(window):idx]
+                        # Drop the newline the sentinel printf prepended
+                        if buf.endswith(b"\n"):
+                            buf = buf[:-1]
+                    tail = data[idx + marker_len:]
+                    if b"\n" not in tail:
+                        tail += await stream.readline()
+                    return bytes(buf), tail
+                if not dropped:
+                    room = byte_cap - len(buf)
+                    if len(chunk) <= room:
+                        buf.extend(chunk)
+                    else:
+                        buf.extend(chunk[:room])
+                        dropped = True
+                window = data[-(marker_len - 1):]
+
+        (stdout_body, rc_tail), (stderr_body, _) = await asyncio.gather(
+            read_stream(worker.stdout),
+            read_stream(worker.stderr)
+        )
+        exit_code = int(rc_tail.partition(b"__")[0])
+        return stdout_body, stderr_body, exit_code
+
 class ShellExecutor:
-    def __init__(self):
+    def __init__(self, use_worker_pool: bool = True):
         # Initialize claude workspace
         self._initialize_workspace()
         self.current_directory = str(CLAUDE_WORKSPACE_DIR)
         self.cache = CommandCache()
+        self.pool = _WorkerPool() if use_worker_pool else None
+        self._cwd_cache: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+        self._exec_sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Cacheable commands currently in flight, keyed like the cache;
+        # concurrent duplicates await the first run instead of re-executing
+        self._inflight: Dict[bytes, "asyncio.Future[Dict[str, Any]]"] = {}
     
     def _initialize_workspace(self):
         """Initialize the Claude workspace directory"""
         try:
             # Create workspace directory if it doesn't exist
             CLAUDE_WORKSPACE_DIR.mkdir(parents=True, exist_ok=True)
-            logger.info(f"Claude workspace initialized at: {CLAUDE_WORKSPACE_DIR}")
-            
-            # Clean up old files
-            self._cleanup_old_files()
-            
+            logger.info("Claude workspace initialized at: %s", CLAUDE_WORKSPACE_DIR)
+
+            # Old-session cleanup is deliberately not done here: it can touch
+            # hundreds of directories and would stall startup. main()
+            # schedules _cleanup_old_files() as a background task instead.
+
             # Create session subdirectory
             session_dir = CLAUDE_WORKSPACE_DIR / f"session-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
             session_dir.mkdir(exist_ok=True)
             
         except Exception as e:
-            logger.error(f"Failed to initialize workspace: {e}")
+            logger.error("Failed to initialize workspace: %s", e)
             # Fall back to home directory if workspace creation fails
-            self.current_directory = os.path.expanduser("~")
+            self.current_directory = _HOME
     
-    def _cleanup_old_files(self):
-        """Clean up files older than WORKSPACE_CLEANUP_DAYS"""
+    async def _cleanup_old_files(self):
+        """Clean up session directories older than WORKSPACE_CLEANUP_DAYS.
+
+        The recursive deletes run in the thread executor and are fanned out
+        concurrently, so neither the event loop nor startup blocks on them.
+        """
+        global _last_cleanup
+        now = time.time()
+        if now - _last_cleanup < WORKSPACE_CLEANUP_THROTTLE:
+            return
+        _last_cleanup = now
+
         try:
             cutoff_time = datetime.now() - timedelta(days=WORKSPACE_CLEANUP_DAYS)
-            
-            for item in CLAUDE_WORKSPACE_DIR.iterdir():
-                if item.is_dir() and item.name.startswith("session-"):
-                    # Check modification time
-                    mtime = datetime.fromtimestamp(item.stat().st_mtime)
-                    if mtime < cutoff_time:
-                        # Remove old session directory
-                        shutil.rmtree(item)
-                        logger.info(f"Cleaned up old session: {item.name}")
-                        
+
+            # scandir exposes cached stat results on its DirEntry objects,
+            # avoiding a second stat syscall per session directory
+            candidates = []
+            with os.scandir(CLAUDE_WORKSPACE_DIR) as entries:
+                for entry in entries:
+                    if (entry.is_dir(follow_symlinks=False)
+                            and entry.name.startswith("session-")):
+                        # Check modification time
+                        mtime = datetime.fromtimestamp(
+                            entry.stat(follow_symlinks=False).st_mtime)
+                        if mtime < cutoff_time:
+                            candidates.append(entry)
+
+            if candidates:
+                # rm -rf walks with unlinkat/fdopendir and skips the
+                # per-entry lstat Python's shutil.rmtree performs, which is
+                # several times faster on deep session trees
+                procs = await asyncio.gather(*(
+                    asyncio.create_subprocess_exec(
+                        "rm", "-rf", entry.path,
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.DEVNULL)
+                    for entry in candidates
+                ))
+                await asyncio.gather(*(proc.wait() for proc in procs))
+                for entry in candidates:
+                    logger.info("Cleaned up old session: %s", entry.name)
+
         except Exception as e:
-            logger.warning(f"Error during workspace cleanup: {e}")
+            logger.warning("Error during workspace cleanup: %s", e)
         
-    def _determine_timeout(self, command: str) -> int:
+    def _determine_timeout(self, first_command: str, command: str) -> int:
         """Determine appropriate timeout based on command type"""
-        command_parts = command.strip().split()
-        if not command_parts:
+        if not first_command:
             return DEFAULT_TIMEOUT
-            
-        first_command = command_parts[0]
-        
-        # Check for long-running commands
-        if any(cmd in command for cmd in LONG_RUNNING_COMMANDS):
+
+        # Cheap set lookup on the first token covers the common case
+        if first_command in LONG_RUNNING_COMMANDS:
             return MAX_TIMEOUT
-        elif first_command in LONG_RUNNING_COMMANDS:
+
+        # Otherwise tokenize once and intersect, so a long-running command
+        # anywhere in a pipeline is caught but quoted text (e.g.
+        # echo "findme") no longer triggers the long timeout
+        try:
+            tokens = shlex.split(command, posix=True)
+        except ValueError:
+            tokens = command.split()
+        if LONG_RUNNING_COMMANDS.intersection(tokens):
             return MAX_TIMEOUT
-        else:
-            return DEFAULT_TIMEOUT
-    
-    def _truncate_output(self, text: str) -> str:
-        """Truncate output if it's too long"""
-        if len(text) > MAX_OUTPUT_SIZE:
-            return text[:MAX_OUTPUT_SIZE] + f"\n... (output truncated, showing first {MAX_OUTPUT_SIZE} characters)"
-        return text
+        return DEFAULT_TIMEOUT
     
+    def _cwd_is_dir(self, path: str) -> bool:
+        """_is_dir with a small TTL cache - a client that keeps passing the
+        same (often repeatedly bad) working directory doesn't cost a stat
+        syscall on every call"""
+        now = time.monotonic()
+        entry = self._cwd_cache.get(path)
+        if entry is not None and now - entry[1] < CWD_CACHE_TTL:
+            self._cwd_cache.move_to_end(path)
+            return entry[0]
+        result = _is_dir(path)
+        self._cwd_cache[path] = (result, now)
+        self._cwd_cache.move_to_end(path)
+        while len(self._cwd_cache) > CWD_CACHE_MAX:
+            self._cwd_cache.popitem(last=False)
+        return result
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Per-loop semaphore bounding concurrent command execution"""
+        loop = asyncio.get_running_loop()
+        if self._exec_sem is None or self._sem_loop is not loop:
+            self._exec_sem = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
+            self._sem_loop = loop
+        return self._exec_sem
+
+    @staticmethod
+    def _kill_process_group(process):
+        """Best-effort kill of a process and its whole group"""
+        try:
+            if process.returncode is None:
+                if hasattr(os, 'killpg') and process.pid is not None:
+                    os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+                else:
+                    process.kill()
+        except Exception:
+            pass
+
     async def _execute_with_timeout(self, command: str, cwd: str, timeout: int) -> Tuple[str, str, int]:
         """Execute command with timeout and proper process management"""
         process = None
         try:
+            # Fast path: commands without shell metacharacters are exec'd
+            # directly, avoiding the extra /bin/sh fork
+            argv = None
+            if _NEEDS_SHELL.search(command) is None:
+                try:
+                    argv = shlex.split(command)
+                except ValueError:
+                    argv = None
+
             # Create process with process group for better cleanup
-            process = await asyncio.create_subprocess_shell(
-                command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=cwd,
-                preexec_fn=os.setsid if hasattr(os, 'setsid') else None
-            )
+            if argv:
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd,
+                    limit=STREAM_LIMIT,
+                    start_new_session=True
+                )
+            else:
+                process = await asyncio.create_subprocess_shell(
+                    command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd,
+                    limit=STREAM_LIMIT,
+                    start_new_session=True
+                )
             
-            # Wait for process with timeout
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(), 
-                timeout=timeout
+            # Read both streams with a hard byte cap instead of communicate(),
+            # which would buffer unbounded child output before truncation
+            cap = MAX_OUTPUT_SIZE * 4
+            stdout_buf = bytearray()
+            stderr_buf = bytearray()
+            capped = False
+
+            async def _drain(stream, buf):
+                nonlocal capped
+                while True:
+                    chunk = await stream.read(65536)
+                    if not chunk:
+                        return
+                    if len(buf) < cap:
+                        buf.extend(chunk)
+                    else:
+                        # Enough output collected - stop the child and keep
+                        # draining so its pipes never fill up and block it
+                        capped = True
+                        self._kill_process_group(process)
+
+            async def _collect():
+                await asyncio.gather(
+                    _drain(process.stdout, stdout_buf),
+                    _drain(process.stderr, stderr_buf)
+                )
+                return await process.wait()
+
+            exit_code = await asyncio.wait_for(_collect(), timeout=timeout)
+
+            # A signal status caused by our own cap-triggered kill is not a
+            # command failure; report the truncated output as a success
+            if capped and exit_code < 0:
+                exit_code = 0
+
+            return (
+                stdout_buf.decode('utf-8', errors='replace'),
+                stderr_buf.decode('utf-8', errors='replace'),
+                exit_code
             )
             
-            return stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace'), process.returncode
-            
         except asyncio.TimeoutError:
-            logger.warning(f"Command timed out after {timeout}s: {command}")
-            
-            # Kill the entire process group if possible
-            if process is not None:
-                try:
-                    if hasattr(os, 'killpg') and hasattr(process, 'pid') and process.pid is not None:
-                        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                        # Give it a moment to terminate gracefully
-                        await asyncio.sleep(1)
-                        # Force kill if still running
-                        try:
-                            os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                        except:
-                            pass
-                    else:
-                        process.terminate()
-                        await asyncio.sleep(1)
-                        if process.returncode is None:
-                            process.kill()
-                except Exception as e:
-                    logger.error(f"Error killing process: {e}")
-                
-                try:
-                    await asyncio.wait_for(process.wait(), timeout=5)
-                except:
-                    pass
-            
+            logger.warning("Command timed out after %ss: %s", timeout, command)
+            # start_new_session=True gives the child its own process group,
+            # so a single SIGKILL to the group reaps the whole pipeline -
+            # no SIGTERM/sleep/SIGKILL dance needed
+            await self._reap(process)
             raise TimeoutError(f"Command timed out after {timeout} seconds")
-        
+
         except Exception as e:
-            logger.error(f"Error executing command: {e}")
-            if process is not None:
-                try:
-                    process.terminate()
-                    await asyncio.wait_for(process.wait(), timeout=5)
-                except:
-                    pass
+            logger.error("Error executing command: %s", e)
+            await self._reap(process)
             raise
+
+    async def _reap(self, process):
+        """Kill a one-shot subprocess's group and wait briefly for it to exit"""
+        if process is None:
+            return
+        self._kill_process_group(process)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except Exception:
+            pass
         
     async def execute_command(self, command: str, working_directory: Optional[str] = None) -> Dict[str, Any]:
         """Execute a shell command safely with performance optimizations"""
+        cache_key = None
+        leader_future = None
         try:
-            if not command or not command.strip():
+            # isspace() avoids allocating a stripped copy just to test it
+            if not command or command.isspace():
                 return {
                     "output": "Error: Command cannot be empty",
                     "exit_code": 1,
@@ -212,32 +620,53 @@ class ShellExecutor:
             cwd = working_directory if working_directory else self.current_directory
             
             # Validate that the directory exists
-            if not os.path.exists(cwd):
+            if not self._cwd_is_dir(cwd):
                 return {
                     "output": f"Error: Directory '{cwd}' does not exist",
                     "exit_code": 1,
                     "error": True
                 }
             
-            # Create cache key
-            cache_key = f"{command}:{cwd}"
-            
-            # Check cache first
-            cached_result = self.cache.get(cache_key)
-            if cached_result:
-                logger.info(f"Returning cached result for: {command}")
-                cached_result["output"] += "\n\n[Result from cache]"
-                return cached_result
-            
+            # The first token decides both cache eligibility and timeout;
+            # compute it once instead of re-splitting per consumer
+            first_command = command.split(None, 1)[0]
+            cacheable = first_command in CACHEABLE_COMMANDS
+
+            # Only cacheable commands pay for key construction and lookup
+            if cacheable:
+                cache_key = _cache_key(command, cwd)
+                cached_result = self.cache.get(cache_key)
+                if cached_result:
+                    logger.info("Returning cached result for: %s", command)
+                    cached_result["output"] += "\n\n[Result from cache]"
+                    return cached_result
+
+                # Dogpile guard: if an identical command is already running,
+                # piggyback on its result instead of executing a duplicate
+                inflight = self._inflight.get(cache_key)
+                if inflight is not None:
+                    return dict(await asyncio.shield(inflight))
+                leader_future = asyncio.get_running_loop().create_future()
+                self._inflight[cache_key] = leader_future
+
             # Determine appropriate timeout
-            timeout = self._determine_timeout(command)
-            
-            # Execute command with timeout
-            stdout_text, stderr_text, exit_code = await self._execute_with_timeout(command, cwd, timeout)
-            
-            # Truncate output if too long
-            stdout_text = self._truncate_output(stdout_text)
-            stderr_text = self._truncate_output(stderr_text)
+            timeout = self._determine_timeout(first_command, command)
+            
+            # Execute command with timeout - via the persistent worker pool
+            # when available, falling back to a one-shot subprocess otherwise.
+            # The semaphore caps how many commands run at once.
+            async with self._get_semaphore():
+                if self.pool is not None:
+                    stdout_text, stderr_text, exit_code = await self.pool.run(command, cwd, timeout)
+                else:
+                    stdout_text, stderr_text, exit_code = await self._execute_with_timeout(command, cwd, timeout)
+            
+            # Truncate output if too long; inlined so the common small-output
+            # case pays only a length check, no call or slice
+            if len(stdout_text) > MAX_OUTPUT_SIZE:
+                stdout_text = stdout_text[:MAX_OUTPUT_SIZE] + _TRUNC_SUFFIX
+            if len(stderr_text) > MAX_OUTPUT_SIZE:
+                stderr_text = stderr_text[:MAX_OUTPUT_SIZE] + _TRUNC_SUFFIX
             
             # Prepare response
             output_parts = []
@@ -246,9 +675,13 @@ class ShellExecutor:
             if stderr_text:
                 output_parts.append(f"STDERR:\n{stderr_text}")
             
-            output_text = "\n\n".join(output_parts) if output_parts else "Command executed with no output"
-            output_text += f"\n\nExit code: {exit_code}"
-            output_text += f"\nWorking directory: {cwd}"
+            if not output_parts:
+                output_parts.append("Command executed with no output")
+            output_parts.append(f"Exit code: {exit_code}\nWorking directory: {cwd}")
+
+            # Single join instead of += appends, each of which recopies the
+            # whole buffer
+            output_text = "\n\n".join(output_parts)
             
             result = {
                 "output": output_text,
@@ -257,77 +690,103 @@ class ShellExecutor:
             }
             
             # Cache the result if appropriate
-            self.cache.set(cache_key, result)
-            
+            if cacheable:
+                self.cache.set(cache_key, result, first_command)
+
+            if leader_future is not None:
+                self._resolve_inflight(cache_key, leader_future, result)
             return result
-            
+
         except TimeoutError as e:
-            return {
+            result = {
                 "output": f"Error: {str(e)}",
                 "exit_code": -1,
                 "error": True
             }
+            if leader_future is not None:
+                self._resolve_inflight(cache_key, leader_future, result)
+            return result
         except Exception as e:
-            logger.error(f"Unexpected error executing command '{command}': {e}")
-            return {
+            logger.error("Unexpected error executing command '%s': %s", command, e)
+            result = {
                 "output": f"Error executing command: {str(e)}",
                 "exit_code": -1,
                 "error": True
             }
+            if leader_future is not None:
+                self._resolve_inflight(cache_key, leader_future, result)
+            return result
+        finally:
+            # If the leader was cancelled before resolving, drop the entry
+            # and cancel waiters so duplicates retry rather than hang
+            if leader_future is not None and not leader_future.done():
+                self._inflight.pop(cache_key, None)
+                leader_future.cancel()
+
+    def _resolve_inflight(self, cache_key: bytes,
+                          leader_future: "asyncio.Future[Dict[str, Any]]",
+                          result: Dict[str, Any]):
+        """Hand the leader's result - success or error dict - to any
+        duplicate requests that piggybacked on it, and clear the entry."""
+        self._inflight.pop(cache_key, None)
+        if not leader_future.done():
+            leader_future.set_result(result)
     
     async def change_directory(self, path: str) -> Dict[str, Any]:
         """Change the current working directory"""
         try:
-            # Expand user home directory and environment variables
-            expanded_path = os.path.expanduser(os.path.expandvars(path))
-            
-            # Handle relative paths from current directory
-            if not os.path.isabs(expanded_path):
-                expanded_path = os.path.join(self.current_directory, expanded_path)
-            
-            abs_path = os.path.abspath(expanded_path)
-            
-            # Check if directory exists and is accessible
-            if not os.path.exists(abs_path):
-                return {
-                    "output": f"Error: Directory '{abs_path}' does not exist",
-                    "error": True
-                }
-            
-            if not os.path.isdir(abs_path):
-                return {
-                    "output": f"Error: '{abs_path}' is not a directory",
-                    "error": True
-                }
-            
-            # Try to access the directory
-            try:
-                os.listdir(abs_path)
-            except PermissionError:
-                return {
-                    "output": f"Error: Permission denied accessing directory '{abs_path}'",
-                    "error": True
-                }
-            except Exception as e:
+            # Expand user home directory / environment variables and resolve
+            # relative paths - memoized for repeat arguments
+            abs_path = _normalize_path(path, self.current_directory)
+
+            # All syscalls happen inside one thread-executor hop so a slow
+            # mount (NFS, SMB) can't stall the event loop, and the loop only
+            # pays one executor round-trip per call
+            loop = asyncio.get_running_loop()
+            probe_error = await loop.run_in_executor(
+                None, self._probe_dir, abs_path)
+            if probe_error is not None:
                 return {
-                    "output": f"Error: Cannot access directory '{abs_path}': {str(e)}",
+                    "output": probe_error,
                     "error": True
                 }
             
-            # Change directory
+            # Change directory; the path was just proven to be a directory,
+            # so refresh any stale probe cached for it
             self.current_directory = abs_path
+            self._cwd_cache[abs_path] = (True, time.monotonic())
             return {
                 "output": f"Changed directory to: {abs_path}",
                 "error": False
             }
             
         except Exception as e:
-            logger.error(f"Error changing directory to '{path}': {e}")
+            logger.error("Error changing directory to '%s': %s", path, e)
             return {
                 "output": f"Error changing directory: {str(e)}",
                 "error": True
             }
     
+    @staticmethod
+    def _probe_dir(abs_path: str) -> Optional[str]:
+        """Validate a target directory, returning an error message or None.
+
+        Blocking; intended to run in the thread executor. One stat plus one
+        access call covers existence, type and permissions.
+        """
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            return f"Error: Directory '{abs_path}' does not exist"
+
+        if not stat.S_ISDIR(st.st_mode):
+            return f"Error: '{abs_path}' is not a directory"
+
+        if not os.access(abs_path, os.R_OK | os.X_OK):
+            return f"Error: Permission denied accessing directory '{abs_path}'"
+
+        return None
+
     def get_current_directory(self) -> Dict[str, Any]:
         """Get the current working directory"""
         try:
@@ -336,7 +795,7 @@ class ShellExecutor:
                 "error": False
             }
         except Exception as e:
-            logger.error(f"Error getting current directory: {e}")
+            logger.error("Error getting current directory: %s", e)
             return {
                 "output": f"Error getting current directory: {str(e)}",
                 "error": True
@@ -350,7 +809,7 @@ class ShellExecutor:
                 "error": False
             }
         except Exception as e:
-            logger.error(f"Error getting workspace directory: {e}")
+            logger.error("Error getting workspace directory: %s", e)
             return {
                 "output": f"Error getting workspace directory: {str(e)}",
                 "error": True
@@ -359,59 +818,70 @@ class ShellExecutor:
 # Create shell executor instance
 shell_executor = ShellExecutor()
 
-@server.list_tools()
-async def handle_list_tools() -> List[Tool]:
-    """List available tools"""
-    return [
+# Immutable tool input schemas; MappingProxyType guards the shared module
+# constants against accidental mutation
+_EXECUTE_COMMAND_SCHEMA = MappingProxyType({
+    "type": "object",
+    "properties": {
+        "command": {
+            "type": "string",
+            "minLength": 1,
+            "description": "The shell command to execute"
+        },
+        "working_directory": {
+            "type": "string",
+            "description": "Working directory for the command (optional)"
+        }
+    },
+    "required": ["command"]
+})
+
+_CHANGE_DIRECTORY_SCHEMA = MappingProxyType({
+    "type": "object",
+    "properties": {
+        "path": {
+            "type": "string",
+            "minLength": 1,
+            "description": "The directory path to change to"
+        }
+    },
+    "required": ["path"]
+})
+
+_NO_ARGS_SCHEMA = MappingProxyType({
+    "type": "object",
+    "properties": {}
+})
+
+# Tool definitions are invariant, so build them once at import instead of
+# reconstructing the Tool objects and their schemas on every tools/list RPC
+_TOOLS = [
         Tool(
             name="execute_command",
             description="Execute a Linux shell command",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "command": {
-                        "type": "string",
-                        "description": "The shell command to execute"
-                    },
-                    "working_directory": {
-                        "type": "string",
-                        "description": "Working directory for the command (optional)"
-                    }
-                },
-                "required": ["command"]
-            }
+            inputSchema=_EXECUTE_COMMAND_SCHEMA
         ),
         Tool(
             name="change_directory",
             description="Change the current working directory",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The directory path to change to"
-                    }
-                },
-                "required": ["path"]
-            }
+            inputSchema=_CHANGE_DIRECTORY_SCHEMA
         ),
         Tool(
             name="get_current_directory",
             description="Get the current working directory",
-            inputSchema={
-                "type": "object",
-                "properties": {}
-            }
+            inputSchema=_NO_ARGS_SCHEMA
         ),
         Tool(
             name="get_workspace_directory",
             description="Get the Claude workspace directory (a safe place for temporary work)",
-            inputSchema={
-                "type": "object",
-                "properties": {}
-            }
+            inputSchema=_NO_ARGS_SCHEMA
         )
-    ]
+]
+
+@server.list_tools()
+async def handle_list_tools() -> List[Tool]:
+    """List available tools"""
+    return _TOOLS
 
 # Add missing MCP endpoints to fix "Method not found" errors
 @server.list_resources()
@@ -424,89 +894,59 @@ async def handle_list_prompts() -> List[Prompt]:
     """List available prompts - Currently no prompts are provided"""
     return []
 
+def _text_response(text: str) -> List[types.TextContent]:
+    """Wrap plain text in the single-item content list MCP expects.
+
+    model_construct skips the pydantic validation pass - safe here because
+    type is a literal and text is always already a str.
+    """
+    return [types.TextContent.model_construct(type="text", text=text)]
+
+async def _handle_execute_command(arguments: dict) -> List[types.TextContent]:
+    # Types are enforced by the tool's inputSchema at the protocol boundary;
+    # only presence needs a friendly in-band error here
+    command = arguments.get("command")
+    if not command:
+        return _text_response("Error: Command parameter is required and must be a string")
+
+    result = await shell_executor.execute_command(
+        command, arguments.get("working_directory"))
+    return _text_response(result["output"])
+
+async def _handle_change_directory(arguments: dict) -> List[types.TextContent]:
+    path = arguments.get("path")
+    if not path:
+        return _text_response("Error: Path parameter is required and must be a string")
+
+    result = await shell_executor.change_directory(path)
+    return _text_response(result["output"])
+
+async def _handle_get_current_directory(arguments: dict) -> List[types.TextContent]:
+    return _text_response(shell_executor.get_current_directory()["output"])
+
+async def _handle_get_workspace_directory(arguments: dict) -> List[types.TextContent]:
+    return _text_response(shell_executor.get_workspace_directory()["output"])
+
+# O(1) dispatch table - adding a tool is one entry here plus one in _TOOLS
+_TOOL_HANDLERS = {
+    "execute_command": _handle_execute_command,
+    "change_directory": _handle_change_directory,
+    "get_current_directory": _handle_get_current_directory,
+    "get_workspace_directory": _handle_get_workspace_directory,
+}
+
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: dict) -> List[types.TextContent]:
     """Handle tool calls with proper error handling"""
     try:
-        if name == "execute_command":
-            command = arguments.get("command")
-            if not command or not isinstance(command, str):
-                return [
-                    types.TextContent(
-                        type="text",
-                        text="Error: Command parameter is required and must be a string"
-                    )
-                ]
-            
-            working_dir = arguments.get("working_directory")
-            if working_dir is not None and not isinstance(working_dir, str):
-                return [
-                    types.TextContent(
-                        type="text",
-                        text="Error: Working directory must be a string"
-                    )
-                ]
-            
-            result = await shell_executor.execute_command(command, working_dir)
-            return [
-                types.TextContent(
-                    type="text",
-                    text=result["output"]
-                )
-            ]
-        
-        elif name == "change_directory":
-            path = arguments.get("path")
-            if not path or not isinstance(path, str):
-                return [
-                    types.TextContent(
-                        type="text",
-                        text="Error: Path parameter is required and must be a string"
-                    )
-                ]
-            
-            result = await shell_executor.change_directory(path)
-            return [
-                types.TextContent(
-                    type="text", 
-                    text=result["output"]
-                )
-            ]
-        
-        elif name == "get_current_directory":
-            result = shell_executor.get_current_directory()
-            return [
-                types.TextContent(
-                    type="text",
-                    text=result["output"]
-                )
-            ]
-        
-        elif name == "get_workspace_directory":
-            result = shell_executor.get_workspace_directory()
-            return [
-                types.TextContent(
-                    type="text",
-                    text=result["output"]
-                )
-            ]
-        
-        else:
-            return [
-                types.TextContent(
-                    type="text",
-                    text=f"Error: Unknown tool '{name}'"
-                )
-            ]
-    
+        handler = _TOOL_HANDLERS.get(name)
+        if handler is None:
+            return _text_response(f"Error: Unknown tool '{name}'")
+        return await handler(arguments)
+
     except Exception as e:
-        logger.error(f"Error in handle_call_tool: {e}")
-        return [
-            types.TextContent(
-                type="text",
-                text=f"Error: {str(e)}"
-            )
-        ]
+        logger.error("Error in handle_call_tool: %s", e)
+        return _text_response(f"Error: {str(e)}")
 
 async def main():
     """Main entry point with error handling"""
@@ -517,27 +957,53 @@ async def main():
         logger.info("Starting MCP Linux Shell Server...")
         logger.info("Initializing server...")
         
-        async with stdio_server() as (read_stream, write_stream):
-            logger.info("Server started and connected successfully")
-            await server.run(
-                read_stream,
-                write_stream,
-                server.create_initialization_options()
-            )
+        # Warm the worker pool so the first tool call doesn't pay spawn cost
+        if shell_executor.pool is not None:
+            await shell_executor.pool.warm()
+
+        # Sweep old workspace sessions without blocking startup
+        cleanup_task = asyncio.create_task(shell_executor._cleanup_old_files())
+
+        # Periodically sweep expired cache entries so they don't linger
+        async def _cache_janitor():
+            while True:
+                await asyncio.sleep(CACHE_CLEANUP_INTERVAL)
+                shell_executor.cache.cleanup_expired()
+
+        janitor_task = asyncio.create_task(_cache_janitor())
+
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                logger.info("Server started and connected successfully")
+                await server.run(
+                    read_stream,
+                    write_stream,
+                    server.create_initialization_options()
+                )
+        finally:
+            janitor_task.cancel()
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
     except Exception as e:
-        logger.error(f"Server error: {e}")
+        logger.error("Server error: %s", e)
         import traceback
         traceback.print_exc()
         raise
 
 if __name__ == "__main__":
+    try:
+        # uvloop's libuv-backed loop is markedly faster at pipe IO and
+        # subprocess handling; fall back silently to the default loop
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Server shutdown completed")
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
+        logger.error("Fatal error: %s", e)
         import sys
         sys.exit(1)
\ No newline at end of file
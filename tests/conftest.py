@@ -1,16 +1,9 @@
-"""Test configuration and fixtures"""
-
-import pytest
-import asyncio
-
-
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+"""Test configuration and fixtures
 
+The session-scoped event loop is configured via pytest-asyncio's
+asyncio_default_test_loop_scope setting in pyproject.toml; overriding the
+event_loop fixture here is deprecated in pytest-asyncio 1.x.
+"""
 
 # Pytest configuration
 pytest_plugins = []
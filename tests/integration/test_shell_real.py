@@ -0,0 +1,28 @@
+"""Integration tests that spawn real shell commands.
+
+These are excluded from the default run (see addopts in pyproject.toml);
+run them explicitly with:
+
+    python -m pytest tests/integration/ -m integration
+"""
+
+import pytest
+
+from linux_shell_server.main import ShellExecutor
+
+pytestmark = pytest.mark.integration
+
+
+class TestShellReal:
+    """Real command execution through an actual shell"""
+
+    @pytest.mark.asyncio
+    async def test_execute_command_success(self):
+        """Test successful command execution against a real shell"""
+        executor = ShellExecutor()
+        result = await executor.execute_command("echo 'Hello World'")
+
+        assert result["error"] is False
+        assert result["exit_code"] == 0
+        assert "Hello World" in result["output"]
+        assert "Exit code: 0" in result["output"]
@@ -1,33 +1,59 @@
 """Tests for the Linux Shell Server MCP implementation"""
 
 import pytest
+import pytest_asyncio
 import asyncio
 import json
-import sys
 import os
+import time
 from unittest.mock import AsyncMock, patch, MagicMock
 
-# Add the parent directory to the path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from linux_shell_server.main import (
+    DEFAULT_TIMEOUT,
+    MAX_OUTPUT_SIZE,
+    MAX_TIMEOUT,
+    ShellExecutor,
+    _cache_key,
+    handle_call_tool,
+    handle_list_tools,
+)
 
-from linux_shell_server.main import ShellExecutor, handle_list_tools, handle_call_tool
+
+@pytest.fixture(scope="module")
+def executor():
+    """One ShellExecutor shared across this module.
+
+    Construction initializes the workspace and probes the filesystem, so
+    tests share a single instance instead of paying that per test; tests
+    that move its current directory restore it afterwards.
+    """
+    return ShellExecutor()
+
+
+@pytest.fixture(scope="session")
+def tmp_work_dir(tmp_path_factory):
+    """One scratch directory shared by every test that needs a real path.
+
+    Creating and destroying a TemporaryDirectory per test is filesystem
+    churn these tests don't need - they only require some directory that
+    exists.
+    """
+    return str(tmp_path_factory.mktemp("shell_tests"))
 
 
 class TestShellExecutor:
     """Test cases for ShellExecutor class"""
     
-    def test_init(self):
+    def test_init(self, executor):
         """Test ShellExecutor initialization"""
-        executor = ShellExecutor()
         assert executor.current_directory is not None
         # Check if it's a valid path
         assert os.path.exists(executor.current_directory)
         # Should initialize to claude-workspace directory
         assert "claude-workspace" in executor.current_directory
     
-    def test_get_current_directory(self):
+    def test_get_current_directory(self, executor):
         """Test getting current directory"""
-        executor = ShellExecutor()
         result = executor.get_current_directory()
         
         assert result["error"] is False
@@ -35,31 +61,29 @@ class TestShellExecutor:
         assert executor.current_directory in result["output"]
     
     @pytest.mark.asyncio
-    async def test_change_directory_success(self):
+    async def test_change_directory_success(self, executor, tmp_work_dir):
         """Test successful directory change"""
-        executor = ShellExecutor()
-        import tempfile
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            result = await executor.change_directory(temp_dir)
-            
+        original_dir = executor.current_directory
+        try:
+            result = await executor.change_directory(tmp_work_dir)
+
             assert result["error"] is False
-            assert f"Changed directory to: {temp_dir}" in result["output"]
-            assert executor.current_directory == temp_dir
+            assert f"Changed directory to: {tmp_work_dir}" in result["output"]
+            assert executor.current_directory == tmp_work_dir
+        finally:
+            executor.current_directory = original_dir
     
     @pytest.mark.asyncio
-    async def test_change_directory_not_exists(self):
+    async def test_change_directory_not_exists(self, executor):
         """Test changing to non-existent directory"""
-        executor = ShellExecutor()
         result = await executor.change_directory("/this/path/does/not/exist")
         
         assert result["error"] is True
         assert "does not exist" in result["output"]
     
     @pytest.mark.asyncio
-    async def test_change_directory_not_directory(self):
+    async def test_change_directory_not_directory(self, executor):
         """Test changing to a file instead of directory"""
-        executor = ShellExecutor()
         import tempfile
         
         with tempfile.NamedTemporaryFile() as temp_file:
@@ -69,23 +93,24 @@ class TestShellExecutor:
             assert ("does not exist" in result["output"] or "not a directory" in result["output"])
     
     @pytest.mark.asyncio
-    async def test_execute_command_success(self):
+    async def test_execute_command_success(self, executor):
         """Test successful command execution"""
-        executor = ShellExecutor()
-        
-        # Use a simple command that works on Linux
-        result = await executor.execute_command("echo 'Hello World'")
-        
+        # Mock out the execution layer; the real-shell equivalent lives in
+        # tests/integration/test_shell_real.py
+        with patch.object(
+            executor.pool, "run",
+            AsyncMock(return_value=("Hello World\n", "", 0)),
+        ):
+            result = await executor.execute_command("echo 'Hello World'")
+
         assert result["error"] is False
         assert result["exit_code"] == 0
         assert "Hello World" in result["output"]
         assert "Exit code: 0" in result["output"]
     
     @pytest.mark.asyncio
-    async def test_execute_command_error(self):
+    async def test_execute_command_error(self, executor):
         """Test command execution with error"""
-        executor = ShellExecutor()
-        
         result = await executor.execute_command("nonexistent_command_12345")
         
         assert result["error"] is True
@@ -96,34 +121,218 @@ class TestShellExecutor:
                 result["exit_code"] != 0)
     
     @pytest.mark.asyncio
-    async def test_execute_command_invalid_directory(self):
+    async def test_execute_command_invalid_directory(self, executor):
         """Test command execution with invalid working directory"""
-        executor = ShellExecutor()
-        
         result = await executor.execute_command("echo test", "/invalid/directory")
         
         assert result["error"] is True
         assert "does not exist" in result["output"]
     
     @pytest.mark.asyncio
-    async def test_execute_command_empty(self):
+    async def test_execute_command_empty(self, executor):
         """Test command execution with empty command"""
-        executor = ShellExecutor()
-        
         result = await executor.execute_command("")
-        
+
         assert result["error"] is True
         assert "cannot be empty" in result["output"]
 
+    @pytest.mark.asyncio
+    async def test_execute_command_timeout(self, executor):
+        """Test the timeout branch without actually sleeping"""
+        # Raise the same TimeoutError the execution layer raises on a real
+        # timeout, so the test covers the error path in milliseconds
+        with patch.object(
+            executor.pool, "run",
+            AsyncMock(side_effect=TimeoutError("Command timed out after 30 seconds")),
+        ):
+            result = await executor.execute_command("sleep 5")
+
+        assert result["error"] is True
+        assert result["exit_code"] == -1
+        assert "timed out" in result["output"]
+
+    @pytest.mark.asyncio
+    async def test_execute_command_truncates_output(self, executor):
+        """Test that oversized output is truncated, without a real subprocess"""
+        # Feed the truncation branch directly; spawning a command that
+        # really prints this much would dominate the test's runtime
+        big_output = "x" * (MAX_OUTPUT_SIZE * 2)
+        with patch.object(
+            executor.pool, "run",
+            AsyncMock(return_value=(big_output, "", 0)),
+        ):
+            result = await executor.execute_command("seq 1 10000")
+
+        assert result["error"] is False
+        assert "output truncated" in result["output"]
+        assert len(result["output"]) < len(big_output)
+
+    @pytest.mark.asyncio
+    async def test_large_output_truncated_not_error(self, executor):
+        """Test that output past the stream limit truncates instead of failing"""
+        # ~2MB of real output; must come back truncated with exit 0, not a
+        # LimitOverrunError surfaced as an execution error
+        result = await executor.execute_command("seq 1 300000")
+
+        assert result["error"] is False
+        assert result["exit_code"] == 0
+        assert "output truncated" in result["output"]
+
+    @pytest.mark.asyncio
+    async def test_large_output_truncated_one_shot(self):
+        """Test that the one-shot path's cap-kill is not reported as failure"""
+        # Hitting the byte cap kills the child; the SIGKILL status must not
+        # leak out as the command's exit code
+        executor = ShellExecutor(use_worker_pool=False)
+        result = await executor.execute_command("seq 1 300000")
+
+        assert result["error"] is False
+        assert result["exit_code"] == 0
+        assert "output truncated" in result["output"]
+
+    @pytest.mark.asyncio
+    async def test_cached_command_fast_path(self, executor):
+        """Test that warmed cache hits skip the subprocess entirely"""
+        # Warm the cache once, then hammer the hit path in a tight loop;
+        # a single measurement would be all jitter
+        await executor.execute_command("pwd")
+
+        iterations = 1000
+        t0 = time.perf_counter_ns()
+        for _ in range(iterations):
+            result = await executor.execute_command("pwd")
+        elapsed_ns = time.perf_counter_ns() - t0
+
+        assert "[Result from cache]" in result["output"]
+        # A real spawn costs milliseconds; cache hits should average far less
+        assert elapsed_ns / iterations < 1_000_000  # < 1ms per call
+
+    @pytest.mark.asyncio
+    async def test_cache_hits_do_not_mutate_entry(self, executor):
+        """Test that cache hits annotate a copy, not the stored entry"""
+        await executor.execute_command("hostname")
+        first = await executor.execute_command("hostname")
+        second = await executor.execute_command("hostname")
+
+        # Each hit carries exactly one marker; they must not accumulate
+        # in the stored entry across hits
+        assert first["output"].count("[Result from cache]") == 1
+        assert second["output"].count("[Result from cache]") == 1
+
+        # The byte accounting only holds if entries never grow in place
+        stored = sum(len(r.get("output", ""))
+                     for r, _ in executor.cache.cache.values())
+        assert executor.cache.total_bytes == stored
+
+    def test_cache_key_cost(self):
+        """Test that cache key construction is cheap and unambiguous"""
+        # Keys must be stable and must not collide when the boundary
+        # between command and cwd shifts
+        assert _cache_key("ls -la", "/tmp") == _cache_key("ls -la", "/tmp")
+        assert _cache_key("ls -la", "/tmp") != _cache_key("ls", "-la /tmp")
+
+        iterations = 100_000
+        t0 = time.perf_counter_ns()
+        for _ in range(iterations):
+            _cache_key("ls -la", "/tmp")
+        elapsed_ns = time.perf_counter_ns() - t0
+
+        # blake2b over a short string is sub-microsecond; the generous
+        # bound just guards against something heavyweight sneaking in
+        assert elapsed_ns / iterations < 10_000  # < 10us per key
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_commands_run_once(self):
+        """Test that concurrent duplicate commands share one execution"""
+        spawn_count = 0
+        real_exec = asyncio.create_subprocess_exec
+
+        async def counting_exec(*args, **kwargs):
+            nonlocal spawn_count
+            spawn_count += 1
+            return await real_exec(*args, **kwargs)
+
+        # One-shot mode spawns per command, so the counter measures the
+        # dogpile guard rather than worker-pool reuse
+        executor = ShellExecutor(use_worker_pool=False)
+        with patch("asyncio.create_subprocess_exec", side_effect=counting_exec):
+            results = await asyncio.gather(
+                *[executor.execute_command("ls -la") for _ in range(50)]
+            )
+
+        assert spawn_count == 1
+        assert all(r["error"] is False for r in results)
+
+    @pytest.mark.asyncio
+    async def test_malformed_command_fails_fast(self, executor):
+        """Test that a syntax error returns promptly instead of timing out"""
+        # An unbalanced quote must surface bash's syntax error immediately
+        # and leave the worker usable, not stall until the timeout
+        result = await executor.execute_command('echo "unclosed')
+
+        assert result["error"] is True
+        assert result["exit_code"] != 0
+
+        follow_up = await executor.execute_command("echo still-alive")
+        assert follow_up["error"] is False
+        assert "still-alive" in follow_up["output"]
+
+    @pytest.mark.asyncio
+    async def test_persistent_shell_reuses_process(self):
+        """Test that sequential commands share one long-lived shell"""
+        spawn_count = 0
+        real_exec = asyncio.create_subprocess_exec
+
+        async def counting_exec(*args, **kwargs):
+            nonlocal spawn_count
+            spawn_count += 1
+            return await real_exec(*args, **kwargs)
+
+        # Distinct non-cacheable commands so neither the cache nor the
+        # dogpile guard can mask a per-command spawn
+        executor = ShellExecutor()
+        with patch("asyncio.create_subprocess_exec", side_effect=counting_exec):
+            for command in ("echo one", "echo two", "echo three", "echo four"):
+                result = await executor.execute_command(command)
+                assert result["exit_code"] == 0
+                assert command.split()[1] in result["output"]
+
+        assert spawn_count == 1
+
+    @pytest.mark.parametrize("command,expected_timeout", [
+        ("ls", DEFAULT_TIMEOUT),
+        ("echo hello", DEFAULT_TIMEOUT),
+        ("find / -name foo", MAX_TIMEOUT),
+        ("grep -r foo /etc", MAX_TIMEOUT),
+        ("tar czf backup.tar.gz .", MAX_TIMEOUT),
+        ("du -sh /var", MAX_TIMEOUT),
+        ("cat access.log | grep 404", MAX_TIMEOUT),
+        ('echo "findme"', DEFAULT_TIMEOUT),
+        ("sleep 1", DEFAULT_TIMEOUT),
+        ("rsync -a src/ dst/", MAX_TIMEOUT),
+    ])
+    def test_determine_timeout(self, executor, command, expected_timeout):
+        """Test timeout selection for representative commands"""
+        first_command = command.split(None, 1)[0]
+        assert executor._determine_timeout(first_command, command) == expected_timeout
+
+
+@pytest_asyncio.fixture(scope="session")
+async def tools():
+    """Tool list fetched once per session.
+
+    handle_list_tools() returns the same module-level list on every call,
+    so fetching it once is enough for every test that inspects it.
+    """
+    return await handle_list_tools()
+
 
 class TestMCPHandlers:
     """Test cases for MCP protocol handlers"""
-    
+
     @pytest.mark.asyncio
-    async def test_list_tools(self):
+    async def test_list_tools(self, tools):
         """Test the list_tools handler"""
-        tools = await handle_list_tools()
-        
         assert len(tools) == 4
         tool_names = [tool.name for tool in tools]
         
@@ -148,16 +357,13 @@ class TestMCPHandlers:
         assert "Current directory:" in result[0].text
     
     @pytest.mark.asyncio
-    async def test_call_tool_change_directory(self):
+    async def test_call_tool_change_directory(self, tmp_work_dir):
         """Test calling change_directory tool"""
-        import tempfile
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            result = await handle_call_tool("change_directory", {"path": temp_dir})
-            
-            assert len(result) == 1
-            assert result[0].type == "text"
-            assert "Changed directory to:" in result[0].text
+        result = await handle_call_tool("change_directory", {"path": tmp_work_dir})
+
+        assert len(result) == 1
+        assert result[0].type == "text"
+        assert "Changed directory to:" in result[0].text
     
     @pytest.mark.asyncio
     async def test_call_tool_execute_command(self):
@@ -174,19 +380,16 @@ class TestMCPHandlers:
         assert ("test" in result[0].text or "Exit code: 0" in result[0].text)
     
     @pytest.mark.asyncio
-    async def test_call_tool_execute_command_with_working_dir(self):
+    async def test_call_tool_execute_command_with_working_dir(self, tmp_work_dir):
         """Test calling execute_command tool with working directory"""
-        import tempfile
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            result = await handle_call_tool("execute_command", {
-                "command": "pwd", 
-                "working_directory": temp_dir
-            })
-            
-            assert len(result) == 1
-            assert result[0].type == "text"
-            assert temp_dir in result[0].text
+        result = await handle_call_tool("execute_command", {
+            "command": "pwd",
+            "working_directory": tmp_work_dir
+        })
+
+        assert len(result) == 1
+        assert result[0].type == "text"
+        assert tmp_work_dir in result[0].text
     
     @pytest.mark.asyncio
     async def test_call_tool_unknown(self):